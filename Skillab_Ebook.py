@@ -1,9 +1,15 @@
 import streamlit as st
-import google.generativeai as genai
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import zlib
 from datetime import datetime
-import os
-import tempfile
-import subprocess
+from html.parser import HTMLParser
+from pathlib import Path
+
+from prompts import SYSTEM_PROMPT, build_prompt
 
 # =====================
 # SECRETS (Streamlit only)
@@ -14,6 +20,118 @@ if "GEMINI_API_KEY" not in st.secrets:
 
 GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
 
+# =====================
+# PERSISTENT CACHE
+# =====================
+CACHE_DIR = ".ebook_cache"
+CACHE_SIZE_LIMIT = 1 << 30
+CACHE_EXPIRE = 7 * 86400
+# Caps worst-case latency/cost per call; a full E-Book is ~3-4k tokens.
+# Thinking tokens count against max_output_tokens, so bound them separately.
+GENERATION_SETTINGS = {
+    "max_output_tokens": 12288,
+    "thinking_config": {"thinking_budget": 2048},
+    "temperature": 0.4,
+    "top_p": 0.95,
+}
+# Lets "Clear cache" drop E-Books without losing pending batch jobs
+EBOOK_TAG = "ebook"
+
+_FOOTER_CAPTION = f"HR Publishing System • {datetime.now().year}"
+
+# Preview is split into top-level <h2> sections that mount as they scroll in
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+_ID_ATTR = re.compile(r"""\bid\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+# Minimum seconds between progressive re-renders while streaming; each
+# render resends the whole partial document to the browser.
+STREAM_RENDER_INTERVAL = 0.25
+
+# Max Gemini calls in flight during batch generation
+BATCH_CONCURRENCY = 5
+
+# Offline (Batch API) jobs, shared by every session through the disk cache
+BATCH_JOBS_KEY = "batch_jobs"
+BATCH_JOB_EXPIRE = 3 * 86400
+_BATCH_FINAL_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+    # Not a Gemini state: the job no longer exists (deleted or purged)
+    "JOB_NOT_FOUND",
+}
+
+# =====================
+# MODELS
+# =====================
+# Flash handles most requests; Pro is only used when Flash output misses
+# required sections.
+PRIMARY_MODEL = "gemini-2.5-flash"
+FALLBACK_MODEL = "gemini-2.5-pro"
+
+# Heading keywords that must appear for the E-Book to count as complete
+REQUIRED_SECTIONS = (
+    "PREFACE",
+    "TABLE OF CONTENTS",
+    "INTRODUCTION",
+    "INDUSTRY EVOLUTION",
+    "ROLES",
+    "SKILLS",
+    "GROWTH OUTLOOK",
+    "HOW TO PREPARE",
+    "INTERPERSONAL",
+    "LEARNING CURVE",
+    "EXAMPLE PROJECTS",
+    "CERTIFICATIONS",
+    "COMPANY EXAMPLES",
+    "SALARY",
+    "CONCLUSION",
+    "APPENDIX",
+)
+_HEADING = re.compile(r"<h[12][^>]*>(.*?)</h[12]>", re.IGNORECASE | re.DOTALL)
+
+# Markdown code fences Gemini sometimes wraps around the HTML
+_FENCE = re.compile(r"```(?:html\s*)?")
+
+# External stylesheet imports (typically Google Fonts) and remote @font-face
+# sources inside <style> blocks would block first paint of the downloaded
+# file on a network fetch. Only style content is rewritten, never body text.
+_STYLE_BLOCK = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.IGNORECASE | re.DOTALL)
+_CSS_IMPORT = re.compile(
+    r"""@import\s+(?:url\([^)]*\)|"[^"]*"|'[^']*')[^;]*;""", re.IGNORECASE
+)
+_REMOTE_FONT_FACE = re.compile(
+    r"""@font-face\s*\{[^}]*url\(\s*["']?(?:https?:)?//[^}]*\}""", re.IGNORECASE
+)
+
+# Allow-list for generated HTML. Document wrappers (<!DOCTYPE>, <html>,
+# <head>, <body>) are not listed, so nh3 drops them along with anything
+# unsafe; the preview embeds the result inside its own <body>.
+# Structural containers must stay: models often put TOC anchor ids on them.
+ALLOWED_TAGS = {
+    "h1", "h2", "h3", "h4", "h5", "h6",
+    "section", "nav", "header", "footer", "article", "main", "aside",
+    "figure", "figcaption",
+    "p", "div", "span", "br", "hr", "blockquote",
+    "ul", "ol", "li", "dl", "dt", "dd",
+    "strong", "em", "b", "i", "u", "small", "sup", "sub", "code", "pre",
+    "table", "caption", "colgroup", "col",
+    "thead", "tbody", "tfoot", "tr", "th", "td",
+    "a", "style",
+}
+ALLOWED_ATTRS = {
+    "*": {"id", "class", "style"},
+    "a": {"href"},
+    "colgroup": {"span"},
+    "col": {"span"},
+    "th": {"colspan", "rowspan", "scope"},
+    "td": {"colspan", "rowspan"},
+}
+
 st.set_page_config(
     page_title="HR E-Book Generator",
     page_icon="📘",
@@ -23,80 +141,583 @@ st.set_page_config(
 # =====================
 # UI STYLING
 # =====================
-st.markdown("""
+PAGE_CSS_PATH = Path(__file__).parent / "assets" / "style.css"
+
+# The file's mtime is part of the key, so CSS edits show up without a
+# restart while unchanged reruns skip the disk read.
+@st.cache_data(show_spinner=False)
+def load_css(path, mtime):
+    return f"<style>\n{Path(path).read_text(encoding='utf-8')}</style>\n"
+
+# =====================
+# GENERATION (STREAMED)
+# =====================
+@st.cache_resource
+def get_cache():
+    import diskcache
+
+    return diskcache.Cache(CACHE_DIR, size_limit=CACHE_SIZE_LIMIT)
+
+def cache_key(community):
+    # Keyed on the rendered prompt, so editing the template retires old
+    # entries without a manual version bump.
+    prompt = build_prompt(community)
+    return hashlib.sha256(
+        f"{PRIMARY_MODEL}|{SYSTEM_PROMPT}|{prompt}".encode()
+    ).hexdigest()
+
+class GenerationJob:
+    # One in-flight generation, shared by every session and batch asking for
+    # the same cache key. Written by its owner, read by anyone attached.
+    def __init__(self):
+        self.model_name = PRIMARY_MODEL
+        self.chunks = []
+        self.usage = None
+        self.truncated = False
+        self.html = ""
+        self.error = None
+        self.done = threading.Event()
+
+@st.cache_resource
+def get_generation_jobs():
+    return threading.Lock(), {}
+
+def claim_generation(key):
+    # Returns (job, owner). Only the owner calls Gemini; everyone else
+    # attaches to the running job instead of starting a second call.
+    lock, jobs = get_generation_jobs()
+    with lock:
+        if key in jobs:
+            return jobs[key], False
+        job = jobs[key] = GenerationJob()
+        return job, True
+
+def finish_generation(key, job):
+    # Entries only live while a call is in flight; finished results are
+    # served from the disk cache.
+    lock, jobs = get_generation_jobs()
+    with lock:
+        if jobs.get(key) is job:
+            del jobs[key]
+    job.done.set()
+
+@st.cache_resource
+def get_client():
+    # Deferred: the SDK import is only needed once a user generates
+    from google import genai
+
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+def generation_config():
+    from google.genai import types
+
+    # SYSTEM_PROMPT is byte-identical on every call and sent ahead of the
+    # per-role request, so Gemini's implicit prefix caching can reuse it.
+    # It is well below the explicit caches.create minimum (1024 tokens on
+    # Flash), so no explicit cache is managed here.
+    return types.GenerateContentConfig(
+        system_instruction=SYSTEM_PROMPT, **GENERATION_SETTINGS
+    )
+
+def clean_html(raw, styles=True):
+    import nh3
+
+    # nh3 parses with html5ever and re-serializes, so the output is also
+    # well-formed. <style> must not be in clean_content_tags while allowed.
+    # Partial output rendered into the page itself drops <style> blocks,
+    # which would otherwise restyle the whole app.
+    html = nh3.clean(
+        _FENCE.sub("", raw),
+        tags=ALLOWED_TAGS if styles else ALLOWED_TAGS - {"style"},
+        attributes=ALLOWED_ATTRS,
+        clean_content_tags={"script", "title"} if styles else {"script", "title", "style"},
+    )
+    return _STYLE_BLOCK.sub(_strip_remote_css, html)
+
+def _strip_remote_css(match):
+    css = _REMOTE_FONT_FACE.sub("", _CSS_IMPORT.sub("", match.group(2)))
+    return match.group(1) + css + match.group(3)
+
+def passes_validation(html):
+    headings = " ".join(_HEADING.findall(html)).upper()
+    return all(section in headings for section in REQUIRED_SECTIONS)
+
+def hit_token_limit(response):
+    from google.genai import types
+
+    candidates = response.candidates or []
+    return bool(candidates) and (
+        candidates[0].finish_reason == types.FinishReason.MAX_TOKENS
+    )
+
+async def generate_ebook(aclient, cache, community):
+    key = cache_key(community)
+    html = cache.get(key)
+    if html:
+        return html
+
+    job, owner = claim_generation(key)
+    if not owner:
+        # Already being generated, interactively or by another batch
+        await asyncio.to_thread(job.done.wait)
+        if job.error:
+            raise ValueError(job.error)
+        if job.truncated:
+            raise ValueError("output hit the token limit")
+        return job.html
+
+    try:
+        job.html = await _generate_ebook(aclient, cache, key, community)
+    except Exception as err:
+        job.error = str(err)
+        raise
+    finally:
+        finish_generation(key, job)
+    return job.html
+
+async def _generate_ebook(aclient, cache, key, community):
+    from google.genai import errors
+
+    html = ""
+    truncated = False
+    for model_name in (PRIMARY_MODEL, FALLBACK_MODEL):
+        try:
+            response = await aclient.models.generate_content(
+                model=model_name,
+                contents=build_prompt(community),
+                config=generation_config(),
+            )
+        except errors.APIError:
+            # A failed fallback (quota, overload) keeps the Flash result
+            if not html:
+                raise
+            break
+        html = clean_html(response.text or "")
+        truncated = hit_token_limit(response)
+        if passes_validation(html) and not truncated:
+            break
+
+    if not html:
+        raise ValueError("no text returned")
+    if truncated:
+        raise ValueError("output hit the token limit")
+    # Incomplete E-Books are returned but not cached, so the next request
+    # retries instead of being served them for the whole cache lifetime.
+    if passes_validation(html):
+        cache.set(key, html, expire=CACHE_EXPIRE, tag=EBOOK_TAG)
+    return html
+
+async def generate_batch(communities):
+    from google import genai
+
+    # asyncio.run() starts a new event loop on every rerun and the async
+    # transport is bound to its loop, so each batch gets its own client,
+    # closed before the loop goes away.
+    cache = get_cache()
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async with genai.Client(api_key=GEMINI_API_KEY).aio as aclient:
+
+        async def gen_one(community):
+            async with sem:
+                return await generate_ebook(aclient, cache, community)
+
+        # One failed role must not discard the rest of the batch.
+        return await asyncio.gather(
+            *(gen_one(c) for c in communities), return_exceptions=True
+        )
+
+# =====================
+# OFFLINE BATCH (GEMINI BATCH API)
+# =====================
+def submit_offline_batch(communities):
+    cache = get_cache()
+    job = get_client().batches.create(
+        model=PRIMARY_MODEL,
+        src=[
+            {
+                "contents": [{"role": "user", "parts": [{"text": build_prompt(c)}]}],
+                "config": {
+                    "system_instruction": SYSTEM_PROMPT,
+                    **GENERATION_SETTINGS,
+                },
+            }
+            for c in communities
+        ],
+        config={"display_name": "hr-ebooks"},
+    )
+
+    with cache.transact():
+        jobs = cache.get(BATCH_JOBS_KEY, [])
+        jobs.append({"name": job.name, "communities": communities})
+        cache.set(BATCH_JOBS_KEY, jobs, expire=BATCH_JOB_EXPIRE)
+
+    return job.name
+
+def collect_offline_batches():
+    from google.genai import errors
+
+    client = get_client()
+    cache = get_cache()
+    finished = {}
+    failed = {}
+    states = {}
+
+    for entry in cache.get(BATCH_JOBS_KEY, []):
+        # One unreachable job must not block collecting the others
+        try:
+            job = client.batches.get(name=entry["name"])
+        except errors.APIError as err:
+            states[entry["name"]] = (
+                "JOB_NOT_FOUND" if err.code == 404 else f"UNAVAILABLE ({err.code})"
+            )
+            continue
+
+        states[entry["name"]] = job.state.name
+
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            continue
+
+        # Inline responses come back in request order
+        responses = (job.dest and job.dest.inlined_responses) or []
+        for community, item in zip(entry["communities"], responses):
+            if item.error:
+                failed[community] = item.error.message or "request failed"
+                continue
+
+            text = item.response and item.response.text
+            if not text:
+                # Blocked, or the output budget went to thinking
+                failed[community] = "no text returned"
+                continue
+            if hit_token_limit(item.response):
+                failed[community] = "output hit the token limit"
+                continue
+
+            html = clean_html(text)
+            cache.set(
+                cache_key(community), html, expire=CACHE_EXPIRE, tag=EBOOK_TAG
+            )
+            finished[community] = html
+
+    with cache.transact():
+        pending = [
+            entry for entry in cache.get(BATCH_JOBS_KEY, [])
+            if states.get(entry["name"]) not in _BATCH_FINAL_STATES
+        ]
+        cache.set(BATCH_JOBS_KEY, pending, expire=BATCH_JOB_EXPIRE)
+
+    return finished, failed, states
+
+def run_generation(job, client, cache, key, community):
+    # Runs on its own thread, outside the page script. A second click
+    # reruns the script and interrupts it, but not this call: the rerun
+    # reattaches to the same job, so the E-Book is paid for once and is
+    # cached even if nobody is left watching. No st.* calls in here.
+    from google.genai import errors
+
+    try:
+        for model_name in (PRIMARY_MODEL, FALLBACK_MODEL):
+            kept = job.model_name, job.usage, job.truncated
+            job.model_name = model_name
+            job.chunks = []
+            job.usage = None
+            job.truncated = False
+            try:
+                for chunk in client.models.generate_content_stream(
+                    model=model_name,
+                    contents=build_prompt(community),
+                    config=generation_config(),
+                ):
+                    # Token counts arrive on the stream itself; no extra
+                    # count_tokens round-trip needed.
+                    job.usage = chunk.usage_metadata or job.usage
+                    # The finish reason rides on the final chunk
+                    job.truncated = job.truncated or hit_token_limit(chunk)
+                    if chunk.text:
+                        job.chunks.append(chunk.text)
+            except errors.APIError:
+                # A failed fallback (quota, overload) keeps the Flash result
+                if not job.html:
+                    raise
+                job.model_name, job.usage, job.truncated = kept
+                break
+
+            job.html = clean_html("".join(job.chunks))
+            if passes_validation(job.html) and not job.truncated:
+                break
+
+        if not job.html:
+            # Blocked, or the output budget went to thinking
+            job.error = "no text returned"
+            return
+
+        # Don't pin a cut-off or incomplete E-Book for the whole cache
+        # lifetime; the next request retries instead.
+        if passes_validation(job.html) and not job.truncated:
+            cache.set(key, job.html, expire=CACHE_EXPIRE, tag=EBOOK_TAG)
+    except Exception as err:
+        job.error = str(err)
+    finally:
+        finish_generation(key, job)
+
+# =====================
+# DOCUMENT TEMPLATE
+# =====================
+# Static shell shared by the preview iframe and the downloaded file; only
+# the E-Book body is filled in per run.
+_HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
 <style>
 body {
-    background-color: #ffffff;
+    font-family: Georgia, "Times New Roman", serif;
+    padding: 30px;
+    line-height: 1.7;
+    background-color: #ffffff !important;
+    color: #000000 !important;
+}
+h2, h3 {
+    font-family: Arial, Helvetica, sans-serif;
+}
+a {
+    color: #1e3799;
+}
+</style>
+</head>
+<body>
+"""
+
+_HTML_TAIL = """
+</body>
+</html>
+"""
+
+_PREVIEW_EDITOR = """<style>
+.editor {
+    outline: none;
 }
-.main-header {
-    font-size: 34px;
-    font-weight: 700;
-    color: #2c3e50;
+.section:empty {
+    min-height: 600px;
 }
-hr {
-    margin: 30px 0;
+.toolbar {
+    position: sticky;
+    top: 0;
+    z-index: 1;
+    padding: 8px 0;
+    text-align: right;
+    background-color: #ffffff;
 }
 </style>
-""", unsafe_allow_html=True)
-
-# =====================
-# PROMPT (UNCHANGED)
-# =====================
-def build_prompt(community):
- return f"""
-You are an Expert Industry Analyst and Career Strategist.
-
-Generate a **professional, publication-ready E-Book** for the community: "{community}".
-
-Rules:
-- Output ONLY valid standalone HTML5
-- No markdown blocks
-- Use <h2>, <h3>, <p>, <ul>, <li>
-- Internal TOC hyperlinks must work
-- Clean, professional formatting
-- Editable document
-
-    **INTERNAL MINDSET (Do not explicitly state this, but embody it):**
-    - What is the Industry? -> Insights, trends.
-    - What is there for Me? -> Roles, specific skills.
-    - How do I enter? -> Actionable roadmaps.
-
- **REQUIRED E-BOOK STRUCTURE (Strictly follow this order and have a golden format same for every resume):**
-    1. PREFACE (Brief executive summary)
-    2. TABLE OF CONTENTS (Hyperlinked internally and strictly Indexed Numbering tabular formatwith excluding 'PREFACE' and 'TABLE OF CONTENTS' in the table)
-    3. INTRODUCTION (Definition and scope of {community})
-    4. INDUSTRY EVOLUTION (History and Future of Development of that respective feild)
-    4. INDUSTRY EVOLUTION (History and Future of Development of that respective field)
-    5. ROLES (Detailed job titles and hierarchies)
-    6. SKILLS (Hard and Soft skills matrix)
-    7. 10-YEAR GROWTH OUTLOOK (Future trends, AI impact)
-    8. HOW TO PREPARE (Prerequisites and mindset)
-    9. INTERPERSONAL & BEHAVIORAL SKILLS (Communication, leadership)
-    10. LEARNING CURVE & ROADMAP (0-6 months, 6-12 months, 1-3 years)
-    11. EXAMPLE PROJECTS (3 specific, real-world portfolio projects with descriptions)
-    12. CERTIFICATIONS / COURSES / TOOLS (Specific names of tools and credentials)
-    13. COMPANY EXAMPLES (List of Top tier, mid-tier, and startups hiring {community} from perspective of Indian Job Market)
-    14. SALARY RANGES & PERKS (Entry, Mid, Senior levels)
-    15. CONCLUSION (Final actionable advice)
-    16. APPENDIX & TEMPLATES (resume keywords)
-
-**CONSTRAINTS:**
-1. NO storytelling, NO metaphors, NO fictional scenarios.
-2. NO conversational filler (e.g., "Let's dive in", "In this guide...") or Conversational Headings.
-3. Make it human refined for GenZ/Youth but maintain a professional documentation format.
-4. Do not output any preamble or post-script instructions;
-5.Do NOT use Markdown syntax of any kind.
- This includes **bold**, *italic*, __underline__, backticks, or markdown headings.
- Use ONLY valid HTML tags such as <strong>, <em>, <ul>, <li>, <p>.
-6. Keep the format same for each request of E Book.
+<div class="toolbar">
+    <button id="download">⬇️ Download HTML (Printable & Editable)</button>
+</div>
+<div id="editor" class="editor" contenteditable="true"></div>
+"""
+
+# Expects `prefix`, `sections`, `suffix`, `anchors`, `docHead`, `docTail`
+# and `fileName` to be defined by a preceding script
+_PREVIEW_SCRIPT = """<script>
+const editor = document.getElementById("editor");
+
+// Rebuild the wrapper the sections were split out of and mount the slots
+// inside it, so its CSS applies to every section.
+const shell = document.createElement("div");
+shell.innerHTML = prefix + "<span data-slots></span>" + suffix;
+const marker = shell.querySelector("[data-slots]");
+
+const slots = sections.map((_, i) => {
+    const slot = document.createElement("div");
+    slot.className = "section";
+    slot.dataset.index = i;
+    marker.parentNode.insertBefore(slot, marker);
+    return slot;
+});
+
+marker.remove();
+editor.append(...shell.childNodes);
+
+// Sections stay mounted once shown so user edits are kept
+function mount(i) {
+    const slot = slots[i];
+    if (slot.dataset.mounted) return;
+    slot.innerHTML = sections[i];
+    slot.dataset.mounted = "1";
+    observer.unobserve(slot);
+}
+
+const observer = new IntersectionObserver((entries) => {
+    entries.forEach((entry) => {
+        if (entry.isIntersecting) mount(+entry.target.dataset.index);
+    });
+}, { rootMargin: "100% 0px" });
+
+slots.forEach((slot) => observer.observe(slot));
+
+// Ctrl/Cmd+click follows TOC links into not-yet-mounted sections
+document.addEventListener("click", (event) => {
+    const link = event.target.closest('a[href^="#"]');
+    if (!link || !(event.ctrlKey || event.metaKey)) return;
+    const id = decodeURIComponent(link.getAttribute("href").slice(1));
+    if (!(id in anchors)) return;
+    event.preventDefault();
+    mount(anchors[id]);
+    document.getElementById(id).scrollIntoView();
+});
+
+// Build the file in the browser from the live (possibly edited) sections,
+// so the document never round-trips through the Streamlit server.
+document.getElementById("download").addEventListener("click", () => {
+    const body = slots
+        .map((slot, i) => (slot.dataset.mounted ? slot.innerHTML : sections[i]))
+        .join("");
+    const blob = new Blob(
+        [docHead + prefix + body + suffix + docTail], { type: "text/html" }
+    );
+    const link = document.createElement("a");
+    link.href = URL.createObjectURL(blob);
+    link.download = fileName;
+    link.click();
+    setTimeout(() => URL.revokeObjectURL(link.href), 1000);
+});
+</script>
 """
 
+# =====================
+# PREVIEW HELPERS
+# =====================
+class _TopLevelScanner(HTMLParser):
+    # Records the span of each top-level element and whether it holds an <h2>
+
+    def __init__(self, html):
+        super().__init__(convert_charrefs=True)
+        self.source = html
+        self.line_starts = [0] + [m.end() for m in re.finditer("\n", html)]
+        self.depth = 0
+        self.children = []
+        self.feed(html)
+        self.close()
+
+    def _offset(self):
+        line, col = self.getpos()
+        return self.line_starts[line - 1] + col
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth == 0:
+            start = self._offset()
+            open_end = start + len(self.get_starttag_text())
+            self.children.append({
+                "tag": tag,
+                "start": start,
+                "open_end": open_end,
+                "close_start": None,
+                "end": open_end if tag in _VOID_TAGS else None,
+                "has_h2": tag == "h2",
+            })
+        elif tag == "h2":
+            self.children[-1]["has_h2"] = True
+
+        if tag not in _VOID_TAGS:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS or self.depth == 0:
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            close_start = self._offset()
+            self.children[-1]["close_start"] = close_start
+            self.children[-1]["end"] = self.source.index(">", close_start) + 1
+
+def _has_stray_text(html, children):
+    pos = 0
+    for child in children:
+        if child["end"] is None or html[pos:child["start"]].strip():
+            return True
+        pos = child["end"]
+    return bool(html[pos:].strip())
+
+def split_sections(html):
+    # Returns (prefix, sections, suffix). Cuts happen only before top-level
+    # elements that are or contain an <h2>, so no section gets half of a
+    # nested element. A single element wrapping the whole E-Book (plus any
+    # sibling <style>) is peeled into prefix/suffix first.
+    prefix = suffix = ""
+
+    while True:
+        children = _TopLevelScanner(html).children
+        elements = [c for c in children if c["tag"] != "style"]
+        if (
+            len(elements) != 1
+            or elements[0]["tag"] == "h2"
+            or not elements[0]["has_h2"]
+            or _has_stray_text(html, children)
+        ):
+            break
+
+        wrapper = elements[0]
+        prefix += html[:wrapper["open_end"]]
+        suffix = html[wrapper["close_start"]:] + suffix
+        html = html[wrapper["open_end"]:wrapper["close_start"]]
+
+    cuts = sorted({0, *(c["start"] for c in children if c["has_h2"])})
+    sections = [html[a:b] for a, b in zip(cuts, cuts[1:] + [len(html)])]
+    return prefix, [s for s in sections if s.strip()], suffix
+
+# E-Books sit zlib-compressed in session_state (~5-8x smaller per session)
+def pack_html(html):
+    return zlib.compress(html.encode("utf-8"), 6)
+
+def unpack_html(blob):
+    return zlib.decompress(blob).decode("utf-8")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def assemble_download(packed):
+    # Keyed on the compressed blob: cheaper to hash, and hits skip the
+    # decompress + encode entirely.
+    return (_HTML_HEAD + unpack_html(packed) + _HTML_TAIL).encode("utf-8")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def preview_parts(packed):
+    # The html.parser scan is pure Python; keyed on the compressed blob so
+    # unrelated reruns (sidebar, batch widgets) reuse the split.
+    prefix, sections, suffix = split_sections(unpack_html(packed))
+    anchors = {
+        anchor: i
+        for i, section in enumerate(sections)
+        for anchor in _ID_ATTR.findall(section)
+    }
+    return prefix, sections, suffix, anchors
+
+def to_script_json(value):
+    # Keep "</script>" inside the HTML from closing the inline script
+    return json.dumps(value).replace("</", "<\\/")
+
 # =====================
 # HEADER
 # =====================
-st.markdown("<div class='main-header'>📘 HR E-Book Generator</div>", unsafe_allow_html=True)
+# Emitted together with the header so each rerun sends one element, not two.
+# (A once-per-session guard would drop the styles: Streamlit removes any
+# element a rerun does not re-emit.)
+st.markdown(
+    load_css(str(PAGE_CSS_PATH), PAGE_CSS_PATH.stat().st_mtime)
+    + "<div class='main-header'>📘 HR E-Book Generator</div>",
+    unsafe_allow_html=True
+)
 st.caption("Generate → Edit directly → Download (HTML → Print to PDF)")
 
+# =====================
+# SIDEBAR
+# =====================
+with st.sidebar:
+    st.subheader("⚙️ Cache")
+    st.caption("Generated E-Books are reused for 7 days across sessions.")
+
+    if st.button("Clear cached E-Books"):
+        removed = get_cache().evict(EBOOK_TAG)
+        st.success(f"Cleared {removed} cached E-Books.")
+
 # =====================
 # INPUT
 # =====================
@@ -115,26 +736,61 @@ with col2:
 # =====================
 # SESSION STATE
 # =====================
-if "ebook_html" not in st.session_state:
-    st.session_state.ebook_html = ""
-
-if "edited_html" not in st.session_state:
-    st.session_state.edited_html = ""
+st.session_state.setdefault("ebook_html", b"")
 
 # =====================
 # GENERATION
 # =====================
 if generate_btn and target_community:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel("gemini-2.5-flash")
-
-    with st.spinner("Generating professional E-Book…"):
-        response = model.generate_content(build_prompt(target_community))
-
-    html = response.text.replace("```html", "").replace("```", "")
-
-    st.session_state.ebook_html = html
-    st.session_state.edited_html = html
+    cache = get_cache()
+    key = cache_key(target_community)
+    html = cache.get(key)
+
+    if not html:
+        job, owner = claim_generation(key)
+        if owner:
+            threading.Thread(
+                target=run_generation,
+                args=(job, get_client(), cache, key, target_community),
+                daemon=True,
+            ).start()
+        else:
+            st.info("This E-Book is already being generated — showing its progress…")
+
+        status = st.empty()
+        placeholder = st.empty()
+
+        while not job.done.wait(STREAM_RENDER_INTERVAL):
+            status.caption(f"Streaming E-Book with {job.model_name}…")
+            if job.chunks:
+                # st.html, not markdown: indented HTML after a blank line
+                # would otherwise render as a CommonMark code block.
+                placeholder.html(clean_html("".join(job.chunks), styles=False))
+
+        status.empty()
+        placeholder.empty()
+        html = job.html
+
+        if job.error:
+            st.error(f"❌ Generation failed: {job.error}")
+        elif job.truncated:
+            st.warning("The E-Book hit the output token limit and may be incomplete.")
+        elif not passes_validation(html):
+            st.warning(
+                "The E-Book is missing required sections and was not cached — "
+                "regenerate to retry."
+            )
+
+        if job.usage:
+            usage = job.usage
+            st.caption(
+                f"{job.model_name} • prompt tokens: {usage.prompt_token_count or 0:,}"
+                f" • output tokens: {usage.candidates_token_count or 0:,}"
+                f" • thinking tokens: {usage.thoughts_token_count or 0:,}"
+            )
+
+    if html:
+        st.session_state.ebook_html = pack_html(html)
 
 # =====================
 # EDITABLE PREVIEW
@@ -144,35 +800,22 @@ if st.session_state.ebook_html:
     st.divider()
     st.subheader("✏️ Editable Preview")
 
-    editable_html = f"""
-    <html>
-    <head>
-        <style>
-            body {{
-              font-family: Georgia, serif;
-              padding: 30px;
-              line-height: 1.7;
-              background-color: #ffffff !important;
-              color: #000000 !important;
-            }}
-            h2, h3 {{
-                font-family: Arial, sans-serif;
-            }}
-            a {{
-                color: #1e3799;
-            }}
-            .editor {{
-                outline: none;
-            }}
-        </style>
-    </head>
-    <body>
-        <div id="editor" class="editor" contenteditable="true">
-            {st.session_state.edited_html}
-        </div>
-    </body>
-    </html>
-    """
+    file_name = f"{target_community.replace(' ', '_')}_HR_Ebook.html"
+    prefix, sections, suffix, anchors = preview_parts(st.session_state.ebook_html)
+
+    editable_html = "".join([
+        _HTML_HEAD,
+        _PREVIEW_EDITOR,
+        "<script>const prefix = ", to_script_json(prefix),
+        ";\nconst sections = ", to_script_json(sections),
+        ";\nconst suffix = ", to_script_json(suffix),
+        ";\nconst anchors = ", to_script_json(anchors),
+        ";\nconst docHead = ", to_script_json(_HTML_HEAD),
+        ";\nconst docTail = ", to_script_json(_HTML_TAIL),
+        ";\nconst fileName = ", to_script_json(file_name), ";</script>",
+        _PREVIEW_SCRIPT,
+        _HTML_TAIL,
+    ])
 
     st.components.v1.html(editable_html, height=750, scrolling=True)
 
@@ -182,6 +825,11 @@ if st.session_state.ebook_html:
     st.divider()
     st.subheader("📥 Download E-Book")
 
+    st.info(
+        "⬇️ Use the Download button at the top of the preview — "
+        "it saves the E-Book including your edits."
+    )
+
     st.info(
         "📄 To get PDF: Download HTML → Open it in your browser → "
         "Press Ctrl+P / Cmd+P → Save as PDF. "
@@ -192,18 +840,88 @@ if st.session_state.ebook_html:
     "NOTE: If E-book is providing unwanted format in Table, Headings, etc. Please Regenerate it."
     )
 
-    st.download_button(
-        label="⬇️ Download HTML (Printable & Editable)",
-        data=st.session_state.edited_html,
-        file_name=f"{target_community.replace(' ', '_')}_HR_Ebook.html",
-        mime="text/html"
+# =====================
+# BATCH MODE
+# =====================
+st.divider()
+
+with st.expander("📚 Batch Mode (multiple roles)"):
+    batch_input = st.text_area(
+        "One community / role per line",
+        placeholder="Data Analyst\nDevOps Engineer\nProduct Manager"
     )
 
+    bcol1, bcol2, bcol3 = st.columns(3)
+    with bcol1:
+        batch_btn = st.button("Generate Batch")
+    with bcol2:
+        offline_btn = st.button("Submit Offline Batch")
+    with bcol3:
+        collect_btn = st.button("Check Offline Batches")
+
+    st.caption(
+        "Offline batches use the Gemini Batch API: roughly half the cost, "
+        "results within 24 hours."
+    )
+
+st.session_state.setdefault("batch_html", {})
+
+communities = list(dict.fromkeys(
+    line.strip() for line in batch_input.splitlines() if line.strip()
+))
+
+if batch_btn and communities:
+    with st.spinner(f"Generating {len(communities)} E-Books…"):
+        results = asyncio.run(generate_batch(communities))
+    st.session_state.batch_html = {}
+    for community, result in zip(communities, results):
+        if isinstance(result, Exception):
+            st.error(f"❌ {community}: {result}")
+        else:
+            if not passes_validation(result):
+                st.warning(f"⚠️ {community}: missing required sections, not cached.")
+            st.session_state.batch_html[community] = pack_html(result)
+
+if offline_btn and communities:
+    job_name = submit_offline_batch(communities)
+    st.success(f"Submitted offline batch {job_name} for {len(communities)} roles.")
+
+if collect_btn:
+    finished, failed, states = collect_offline_batches()
+    st.session_state.batch_html.update(
+        (community, pack_html(html)) for community, html in finished.items()
+    )
+
+    if not states:
+        st.info("No offline batches pending.")
+    for job_name, state in states.items():
+        st.write(f"`{job_name}` → {state}")
+    for community, reason in failed.items():
+        st.error(f"❌ {community}: {reason}")
+
+if st.session_state.batch_html:
+    st.subheader("📥 Batch Downloads")
+
+    batch_items = list(st.session_state.batch_html.items())
+    tabs = st.tabs([community for community, _ in batch_items])
+
+    for tab, (community, packed) in zip(tabs, batch_items):
+        with tab:
+            data = assemble_download(packed)
+            st.caption(f"{len(data) / 1024:,.0f} KB HTML")
+            st.download_button(
+                label=f"⬇️ Download {community}",
+                data=data,
+                file_name=f"{community.replace(' ', '_')}_HR_Ebook.html",
+                mime="text/html",
+                key=f"batch_{community}"
+            )
+
 # =====================
 # FOOTER
 # =====================
 st.markdown("---")
-st.caption(f"HR Publishing System • {datetime.now().year}")
+st.caption(_FOOTER_CAPTION)
 
 
 